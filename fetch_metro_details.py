@@ -13,13 +13,36 @@ Author: AI Assistant
 Date: 2024
 """
 
-import json
+import orjson
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 import time
 import re
+import shelve
+import threading
 from urllib.parse import quote
+from concurrent.futures import ThreadPoolExecutor
+import argparse
 import sys
 
+# Coordinate formats found in Google Maps responses, compiled once
+_COORD_PATTERNS = [re.compile(p) for p in (
+    r'@([0-9.-]+),([0-9.-]+)',
+    r'!3d([0-9.-]+)!4d([0-9.-]+)',
+    r'center=([0-9.-]+)%2C([0-9.-]+)',
+    r'"lat":\s*([0-9.-]+),\s*"lng":\s*([0-9.-]+)',
+    r'([0-9]{2}\.[0-9]{6,7}),([0-9]{2,3}\.[0-9]{6,7})'
+)]
+
+# Bounding box used to validate scraped coordinates (Kolkata is roughly 22.5°N, 88.3°E)
+_MIN_LAT, _MAX_LAT = 22.0, 23.0
+_MIN_LNG, _MAX_LNG = 87.0, 89.0
+
+def _has_7dp(value):
+    """Check that a coordinate carries no more than 7 decimal places."""
+    return value == round(value, 7)
+
 class MetroStationFetcher:
     """Main class for fetching and managing Kolkata metro station data."""
     
@@ -32,12 +55,72 @@ class MetroStationFetcher:
             'Accept-Encoding': 'gzip, deflate',
             'Connection': 'keep-alive',
         }
+        # Number of stations scraped concurrently, and the minimum spacing in
+        # seconds between requests across all workers to avoid being blocked
+        self.max_workers = 4
+        self.rate_delay = 2
+        # Slower spacing for the force-fix re-scrape of imprecise coordinates
+        self.force_rate_delay = 3
+        self._rate_lock = threading.Lock()
+        self._next_request_at = 0.0
+        
+        # Shared session so connections to Google Maps are pooled and reused
+        self.session = requests.Session()
+        self.session.headers.update(self.headers)
+        adapter = HTTPAdapter(
+            pool_connections=4,
+            pool_maxsize=16,
+            max_retries=Retry(total=3, backoff_factor=0.5)
+        )
+        self.session.mount('https://', adapter)
+        
+        # Persistent cache of successful scrapes, keyed by "station|location"
+        self.cache_file = '.metro_cache.db'
+        self.cache_ttl = 30 * 86400
+        self._cache_lock = threading.Lock()
+    
+    def get_cached_coordinates(self, station_name, location="Kolkata"):
+        """
+        Look up previously scraped coordinates for a station.
+        Returns (latitude, longitude), or None if missing, older than cache_ttl,
+        or the cache cannot be read. The cache is best-effort and never raises.
+        """
+        try:
+            with self._cache_lock, shelve.open(self.cache_file) as cache:
+                hit = cache.get(f"{station_name}|{location}")
+        except Exception as e:
+            print(f"Warning: could not read scrape cache for {station_name}: {e}")
+            return None
+        
+        if hit and time.time() - hit[2] < self.cache_ttl:
+            return hit[0], hit[1]
+        return None
+    
+    def _cache_coordinates(self, station_name, location, lat, lng):
+        """Remember successfully scraped coordinates for a station, skipping on cache errors."""
+        try:
+            with self._cache_lock, shelve.open(self.cache_file) as cache:
+                cache[f"{station_name}|{location}"] = (lat, lng, time.time())
+        except Exception as e:
+            print(f"Warning: could not write scrape cache for {station_name}: {e}")
     
     def get_google_maps_coordinates(self, station_name, location="Kolkata"):
         """
-        Get precise coordinates from Google Maps for a station.
+        Get precise coordinates from Google Maps for a station, using the scrape
+        cache when possible.
         Returns (latitude, longitude) with 7 decimal precision.
         """
+        cached = self.get_cached_coordinates(station_name, location)
+        if cached:
+            return cached
+        
+        return self._scrape_google_maps(station_name, location)
+    
+    def _scrape_google_maps(self, station_name, location="Kolkata"):
+        """
+        Scrape Google Maps for a station without consulting the cache.
+        Successful results are stored in the cache.
+        """
         try:
             # Construct search query
             search_query = f"{station_name} metro station {location}"
@@ -46,28 +129,21 @@ class MetroStationFetcher:
             # Use Google Maps search
             url = f"https://www.google.com/maps/search/{encoded_query}"
             
-            response = requests.get(url, headers=self.headers, timeout=15)
+            response = self.session.get(url, timeout=15)
             
             if response.status_code == 200:
                 # Look for coordinates in various formats
-                patterns = [
-                    r'@([0-9.-]+),([0-9.-]+)',
-                    r'!3d([0-9.-]+)!4d([0-9.-]+)',
-                    r'center=([0-9.-]+)%2C([0-9.-]+)',
-                    r'"lat":\s*([0-9.-]+),\s*"lng":\s*([0-9.-]+)',
-                    r'([0-9]{2}\.[0-9]{6,7}),([0-9]{2,3}\.[0-9]{6,7})'
-                ]
-                
-                for pattern in patterns:
-                    matches = re.findall(pattern, response.text)
-                    if matches:
-                        for lat, lng in matches:
-                            lat_f = float(lat)
-                            lng_f = float(lng)
-                            
-                            # Validate coordinates are in Kolkata area
-                            if 22.0 <= lat_f <= 23.0 and 87.0 <= lng_f <= 89.0:
-                                return round(lat_f, 7), round(lng_f, 7)
+                for pattern in _COORD_PATTERNS:
+                    # finditer scans lazily, so we stop at the first valid hit
+                    for match in pattern.finditer(response.text):
+                        lat_f = float(match.group(1))
+                        lng_f = float(match.group(2))
+                        
+                        # Validate coordinates are in Kolkata area
+                        if _MIN_LAT <= lat_f <= _MAX_LAT and _MIN_LNG <= lng_f <= _MAX_LNG:
+                            lat_f, lng_f = round(lat_f, 7), round(lng_f, 7)
+                            self._cache_coordinates(station_name, location, lat_f, lng_f)
+                            return lat_f, lng_f
             
             # If no coordinates found, return None
             return None, None
@@ -79,6 +155,7 @@ class MetroStationFetcher:
     def get_coordinates_alternative(self, station_name, location="Kolkata"):
         """
         Alternative method using different Google Maps endpoints.
+        Returns (latitude, longitude) with 7 decimal precision.
         """
         try:
             # Try different Google Maps URL formats
@@ -100,27 +177,18 @@ class MetroStationFetcher:
                 
                 for url in urls:
                     try:
-                        response = requests.get(url, headers=self.headers, timeout=10)
+                        response = self.session.get(url, timeout=10)
                         
                         if response.status_code == 200:
                             # Look for coordinates in various formats
-                            coord_patterns = [
-                                r'@([0-9.-]+),([0-9.-]+)',
-                                r'!3d([0-9.-]+)!4d([0-9.-]+)',
-                                r'center=([0-9.-]+)%2C([0-9.-]+)',
-                                r'"lat":\s*([0-9.-]+),\s*"lng":\s*([0-9.-]+)',
-                                r'([0-9]{2}\.[0-9]{6,7}),([0-9]{2,3}\.[0-9]{6,7})'
-                            ]
-                            
-                            for pattern in coord_patterns:
-                                matches = re.findall(pattern, response.text)
-                                if matches:
-                                    lat, lng = matches[0]
-                                    # Validate coordinates (Kolkata is roughly 22.5°N, 88.3°E)
-                                    if 22.0 <= float(lat) <= 23.0 and 87.0 <= float(lng) <= 89.0:
-                                        return float(lat), float(lng)
-                        
-                        time.sleep(1)  # Rate limiting
+                            for pattern in _COORD_PATTERNS:
+                                match = pattern.search(response.text)
+                                if match:
+                                    lat_f = float(match.group(1))
+                                    lng_f = float(match.group(2))
+                                    # Validate coordinates are in Kolkata area
+                                    if _MIN_LAT <= lat_f <= _MAX_LAT and _MIN_LNG <= lng_f <= _MAX_LNG:
+                                        return round(lat_f, 7), round(lng_f, 7)
                         
                     except Exception as e:
                         continue
@@ -131,11 +199,45 @@ class MetroStationFetcher:
             print(f"Alternative method failed for {station_name}: {e}")
             return None, None
     
+    def _wait_for_rate_limit(self, delay):
+        """Block until the shared rate limit allows another request, delay seconds after the last."""
+        with self._rate_lock:
+            now = time.monotonic()
+            wait = self._next_request_at - now
+            # Reserve the next slot before sleeping so other workers queue behind it
+            self._next_request_at = max(now, self._next_request_at) + delay
+        
+        if wait > 0:
+            time.sleep(wait)
+    
+    def scrape_coordinates(self, stations, delay=None):
+        """
+        Scrape coordinates for several stations using a bounded pool of workers.
+        Workers share one rate limit, so concurrency only overlaps network latency.
+        Requests are spaced delay seconds apart (default: rate_delay).
+        Yields (station, (latitude, longitude)) in input order.
+        """
+        if delay is None:
+            delay = self.rate_delay
+        
+        def fetch(station):
+            # Cache hits need no request, so they skip the rate limit
+            cached = self.get_cached_coordinates(station['name'])
+            if cached:
+                return cached
+            
+            # Rate limiting to avoid being blocked
+            self._wait_for_rate_limit(delay)
+            return self._scrape_google_maps(station['name'])
+        
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            yield from zip(stations, executor.map(fetch, stations))
+    
     def load_stations(self):
         """Load the existing metro stations from JSON file."""
         try:
-            with open(self.stations_file, 'r', encoding='utf-8') as f:
-                return json.load(f)
+            with open(self.stations_file, 'rb') as f:
+                return orjson.loads(f.read())
         except FileNotFoundError:
             print(f"Error: {self.stations_file} not found!")
             return None
@@ -146,8 +248,8 @@ class MetroStationFetcher:
     def save_stations(self, stations):
         """Save the updated metro stations to JSON file."""
         try:
-            with open(self.stations_file, 'w', encoding='utf-8') as f:
-                json.dump(stations, f, indent=2, ensure_ascii=False)
+            with open(self.stations_file, 'wb') as f:
+                f.write(orjson.dumps(stations, option=orjson.OPT_INDENT_2))
             print("✅ Updated kolkata_metro_stations.json successfully!")
         except Exception as e:
             print(f"❌ Error saving file: {e}")
@@ -161,79 +263,94 @@ class MetroStationFetcher:
             lat = station.get('latitude', 0)
             lng = station.get('longitude', 0)
             
-            lat_str = f'{lat:.7f}'
-            lng_str = f'{lng:.7f}'
-            
-            lat_decimals = len(lat_str.split('.')[-1])
-            lng_decimals = len(lng_str.split('.')[-1])
-            
-            is_correct = lat_decimals == 7 and lng_decimals == 7
+            is_correct = _has_7dp(lat) and _has_7dp(lng)
             
             if not is_correct:
                 all_correct = False
-                print(f"❌ {i}. {station['name']}: {lat_str} ({lat_decimals} decimals), {lng_str} ({lng_decimals} decimals)")
+                print(f"❌ {i}. {station['name']}: {lat}, {lng} (more than 7 decimals)")
             else:
-                print(f"✅ {i}. {station['name']}: {lat_str}, {lng_str}")
+                print(f"✅ {i}. {station['name']}: {lat:.7f}, {lng:.7f}")
         
         return all_correct
     
-    def scrape_all_coordinates(self):
-        """Scrape coordinates for all metro stations."""
-        print("🚇 Kolkata Metro Station Coordinates Scraper")
-        print("=" * 50)
+    def _needs_scrape(self, station, missing_only=False):
+        """
+        Check whether a station's coordinates are missing or below 7 decimal precision.
+        With missing_only, only missing or non-numeric coordinates count.
+        """
+        lat = station.get('latitude')
+        lng = station.get('longitude')
         
-        # Load existing stations
-        stations = self.load_stations()
-        if not stations:
-            return
+        if not isinstance(lat, (int, float)) or not isinstance(lng, (int, float)):
+            return True
         
-        print(f"Found {len(stations)} metro stations to process...")
+        if missing_only:
+            return False
         
+        # A value with fewer than 7 decimals is unchanged by rounding to 6
+        return lat == round(lat, 6) or lng == round(lng, 6)
+    
+    def _ensure_precise(self, stations, delay=None, missing_only=False):
+        """
+        Scrape Google Maps for every station that needs more precise coordinates,
+        or only for stations without coordinates when missing_only is set.
+        Returns (updated_count, failed_stations).
+        """
         updated_count = 0
         failed_stations = []
+        pending = []
         
         for i, station in enumerate(stations, 1):
             station_name = station['name']
             print(f"\n[{i}/{len(stations)}] Processing: {station_name}")
             
-            # Check if coordinates already exist and are precise
-            if 'latitude' in station and 'longitude' in station:
-                lat = station['latitude']
-                lng = station['longitude']
-                
-                # Check if coordinates are already 7 decimal precision
-                if isinstance(lat, (int, float)) and isinstance(lng, (int, float)):
-                    lat_str = f"{lat:.7f}"
-                    lng_str = f"{lng:.7f}"
-                    
-                    if len(lat_str.split('.')[-1]) >= 7 and len(lng_str.split('.')[-1]) >= 7:
-                        print(f"  ✅ Already has 7 decimal precision: {lat_str}, {lng_str}")
-                        continue
+            if not self._needs_scrape(station, missing_only):
+                if missing_only:
+                    print(f"  ✅ Already has coordinates: {station['latitude']:.7f}, {station['longitude']:.7f}")
+                else:
+                    print(f"  ✅ Already has 7 decimal precision: {station['latitude']}, {station['longitude']}")
+                continue
             
-            # Scrape coordinates
-            print(f"  🔍 Scraping coordinates for {station_name}...")
-            lat, lng = self.get_google_maps_coordinates(station_name)
+            pending.append(station)
+        
+        if pending:
+            print(f"\n🔍 Scraping Google Maps for {len(pending)} stations ({self.max_workers} at a time)...")
+        
+        # Get new coordinates
+        for station, (lat, lng) in self.scrape_coordinates(pending, delay):
+            station_name = station['name']
             
             if lat is not None and lng is not None:
-                # Format to 7 decimal places
+                # Ensure 7 decimal precision
                 lat = round(lat, 7)
                 lng = round(lng, 7)
                 
                 station['latitude'] = lat
                 station['longitude'] = lng
                 
-                print(f"  ✅ Found coordinates: {lat:.7f}, {lng:.7f}")
+                print(f"  ✅ {station_name}: Updated coordinates: {lat:.7f}, {lng:.7f}")
                 updated_count += 1
             else:
-                print(f"  ❌ Could not find coordinates for {station_name}")
+                print(f"  ❌ Could not get coordinates for {station_name}")
                 failed_stations.append(station_name)
-            
-            # Rate limiting to avoid being blocked
-            time.sleep(2)
-        
-        # Save updated stations
-        self.save_stations(stations)
         
+        return updated_count, failed_stations
+    
+    def _round_coordinates(self, stations):
+        """Round every station's coordinates to exactly 7 decimal places."""
+        for i, station in enumerate(stations, 1):
+            # Force to 7 decimal precision
+            lat_7_decimals = round(float(station.get('latitude', 0)), 7)
+            lng_7_decimals = round(float(station.get('longitude', 0)), 7)
+            
+            # Update coordinates
+            station['latitude'] = lat_7_decimals
+            station['longitude'] = lng_7_decimals
+            
+            print(f"  ✅ {i}. {station['name']}: {lat_7_decimals:.7f}, {lng_7_decimals:.7f}")
+    
+    def _print_summary(self, updated_count, failed_stations):
+        """Print the result of a scraping pass."""
         print(f"\n📊 Summary:")
         print(f"  ✅ Successfully updated: {updated_count} stations")
         print(f"  ❌ Failed to update: {len(failed_stations)} stations")
@@ -242,6 +359,35 @@ class MetroStationFetcher:
             print(f"\n❌ Failed stations:")
             for station in failed_stations:
                 print(f"  - {station}")
+    
+    def _verify(self, stations):
+        """Verify coordinate precision and print the final summary."""
+        all_correct = self.verify_coordinate_precision(stations)
+        
+        print(f"\n📊 FINAL SUMMARY:")
+        if all_correct:
+            print('🎉 SUCCESS! ALL STATIONS NOW HAVE EXACTLY 7 DECIMAL PRECISION!')
+            print('✅ All coordinates are properly formatted and ready for use.')
+        else:
+            print('❌ Some stations still need fixing')
+    
+    def scrape_all_coordinates(self):
+        """Scrape coordinates for all metro stations."""
+        print("🚇 Kolkata Metro Station Coordinates Scraper")
+        print("=" * 50)
+        
+        # Load existing stations
+        stations = self.load_stations()
+        if not stations:
+            return
+        
+        print(f"Found {len(stations)} metro stations to process...")
+        
+        updated_count, failed_stations = self._ensure_precise(stations, missing_only=True)
+        
+        # Save updated stations
+        self.save_stations(stations)
+        self._print_summary(updated_count, failed_stations)
         
         print(f"\n🎉 Scraping complete! Check {self.stations_file} for results.")
     
@@ -258,62 +404,11 @@ class MetroStationFetcher:
         
         print(f"📊 Found {len(stations)} stations to process")
         
-        updated_count = 0
-        failed_stations = []
-        
-        for i, station in enumerate(stations, 1):
-            station_name = station['name']
-            print(f"\n[{i}/{len(stations)}] Processing: {station_name}")
-            
-            # Check current precision
-            current_lat = station.get('latitude', 0)
-            current_lng = station.get('longitude', 0)
-            
-            # Check if already has 7 decimal precision
-            lat_str = str(current_lat)
-            lng_str = str(current_lng)
-            
-            lat_decimals = len(lat_str.split('.')[-1]) if '.' in lat_str else 0
-            lng_decimals = len(lng_str.split('.')[-1]) if '.' in lng_str else 0
-            
-            if lat_decimals >= 7 and lng_decimals >= 7:
-                print(f"  ✅ Already has 7 decimal precision: {lat_str}, {lng_str}")
-                continue
-            
-            print(f"  🔍 Current precision: {lat_decimals}, {lng_decimals} decimals")
-            print(f"  🔍 Scraping Google Maps for {station_name}...")
-            
-            # Get new coordinates
-            lat, lng = self.get_google_maps_coordinates(station_name)
-            
-            if lat is not None and lng is not None:
-                # Ensure 7 decimal precision
-                lat = round(lat, 7)
-                lng = round(lng, 7)
-                
-                station['latitude'] = lat
-                station['longitude'] = lng
-                
-                print(f"  ✅ Updated coordinates: {lat:.7f}, {lng:.7f}")
-                updated_count += 1
-            else:
-                print(f"  ❌ Could not get coordinates for {station_name}")
-                failed_stations.append(station_name)
-            
-            # Rate limiting
-            time.sleep(3)
+        updated_count, failed_stations = self._ensure_precise(stations, delay=self.force_rate_delay)
         
         # Save updated stations
         self.save_stations(stations)
-        
-        print(f"\n📊 Summary:")
-        print(f"  ✅ Successfully updated: {updated_count} stations")
-        print(f"  ❌ Failed to update: {len(failed_stations)} stations")
-        
-        if failed_stations:
-            print(f"\n❌ Failed stations:")
-            for station in failed_stations:
-                print(f"  - {station}")
+        self._print_summary(updated_count, failed_stations)
         
         print(f"\n🎉 Coordinate fixing complete!")
     
@@ -330,32 +425,13 @@ class MetroStationFetcher:
         
         print(f"📊 Found {len(stations)} stations to process")
         
-        updated_count = 0
-        
-        for i, station in enumerate(stations, 1):
-            station_name = station['name']
-            print(f"\n[{i}/{len(stations)}] Processing: {station_name}")
-            
-            # Get current coordinates
-            current_lat = station.get('latitude', 0)
-            current_lng = station.get('longitude', 0)
-            
-            # Force to 7 decimal precision
-            lat_7_decimals = round(float(current_lat), 7)
-            lng_7_decimals = round(float(current_lng), 7)
-            
-            # Update coordinates
-            station['latitude'] = lat_7_decimals
-            station['longitude'] = lng_7_decimals
-            
-            print(f"  ✅ Updated to: {lat_7_decimals:.7f}, {lng_7_decimals:.7f}")
-            updated_count += 1
+        self._round_coordinates(stations)
         
         # Save updated stations
         self.save_stations(stations)
         
         print(f"\n📊 Summary:")
-        print(f"  ✅ Successfully updated: {updated_count} stations")
+        print(f"  ✅ Successfully updated: {len(stations)} stations")
         print(f"  🎉 ALL coordinates now have 7 decimal precision!")
     
     def verify_all_coordinates(self):
@@ -368,14 +444,31 @@ class MetroStationFetcher:
             print("❌ Could not load stations!")
             return
         
-        all_correct = self.verify_coordinate_precision(stations)
+        self._verify(stations)
+    
+    def run_all(self):
+        """Scrape, round and verify all coordinates with a single load and save."""
+        print("🔄 Running all operations...")
+        print("=" * 50)
         
-        print(f"\n📊 FINAL SUMMARY:")
-        if all_correct:
-            print('🎉 SUCCESS! ALL STATIONS NOW HAVE EXACTLY 7 DECIMAL PRECISION!')
-            print('✅ All coordinates are properly formatted and ready for use.')
-        else:
-            print('❌ Some stations still need fixing')
+        stations = self.load_stations()
+        if not stations:
+            print("❌ Could not load stations!")
+            return
+        
+        print(f"📊 Found {len(stations)} stations to process")
+        
+        updated_count, failed_stations = self._ensure_precise(stations, delay=self.force_rate_delay)
+        
+        print("\n🔧 Rounding all coordinates to 7 decimal precision...")
+        self._round_coordinates(stations)
+        
+        # Save updated stations
+        self.save_stations(stations)
+        self._print_summary(updated_count, failed_stations)
+        
+        print()
+        self._verify(stations)
     
     def create_initial_stations_data(self):
         """Create initial metro stations data structure."""
@@ -399,8 +492,8 @@ class MetroStationFetcher:
             # Add more stations as needed
         ]
         
-        with open(self.stations_file, 'w', encoding='utf-8') as f:
-            json.dump(stations, f, indent=2, ensure_ascii=False)
+        with open(self.stations_file, 'wb') as f:
+            f.write(orjson.dumps(stations, option=orjson.OPT_INDENT_2))
         
         print(f"✅ Created initial {self.stations_file} with {len(stations)} stations")
 
@@ -408,36 +501,29 @@ def main():
     """Main function to run the metro station fetcher."""
     fetcher = MetroStationFetcher()
     
+    operations = {
+        'scrape': fetcher.scrape_all_coordinates,
+        'force': fetcher.force_fix_coordinates,
+        'final': fetcher.final_fix_coordinates,
+        'verify': fetcher.verify_all_coordinates,
+        'init': fetcher.create_initial_stations_data,
+        'all': fetcher.run_all,
+    }
+    
+    parser = argparse.ArgumentParser(description="Kolkata Metro Station Details Fetcher")
+    parser.add_argument(
+        'op',
+        choices=operations,
+        help="scrape: scrape all coordinates, force: force fix coordinates, "
+             "final: final fix coordinates, verify: verify coordinates, "
+             "init: create initial data, all: run all operations"
+    )
+    args = parser.parse_args()
+    
     print("🚇 Kolkata Metro Station Details Fetcher")
     print("=" * 50)
-    print("Available operations:")
-    print("1. Scrape all coordinates")
-    print("2. Force fix coordinates")
-    print("3. Final fix coordinates")
-    print("4. Verify coordinates")
-    print("5. Create initial data")
-    print("6. Run all operations")
     
-    choice = input("\nEnter your choice (1-6): ").strip()
-    
-    if choice == "1":
-        fetcher.scrape_all_coordinates()
-    elif choice == "2":
-        fetcher.force_fix_coordinates()
-    elif choice == "3":
-        fetcher.final_fix_coordinates()
-    elif choice == "4":
-        fetcher.verify_all_coordinates()
-    elif choice == "5":
-        fetcher.create_initial_stations_data()
-    elif choice == "6":
-        print("🔄 Running all operations...")
-        fetcher.scrape_all_coordinates()
-        fetcher.force_fix_coordinates()
-        fetcher.final_fix_coordinates()
-        fetcher.verify_all_coordinates()
-    else:
-        print("❌ Invalid choice. Please run the script again.")
+    operations[args.op]()
 
 if __name__ == "__main__":
     main()